@@ -5,22 +5,32 @@ Multi-Agent Gemini Proxy Server with Advanced Features
 """
 
 import asyncio
+import atexit
 import json
 import logging
 import os
+import queue
+import sqlite3
 import subprocess
 import sys
+import threading
 import time
+import uuid
 import yaml
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import aiohttp
 import aiofiles
 from dataclasses import dataclass
 from collections import deque
 import hashlib
+import heapq
 import random
+import re
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
 
 # Налаштування логування
 logging.basicConfig(
@@ -31,13 +41,16 @@ logger = logging.getLogger(__name__)
 
 # Flask imports
 try:
-    from flask import Flask, request, jsonify
+    from flask import Flask, Response, request, jsonify
     from flask_cors import CORS
     FLASK_AVAILABLE = True
 except ImportError as e:
     logger.warning(f"Flask not available: {e}")
     FLASK_AVAILABLE = False
 
+# Режими паралельного делегування (fan-out)
+FANOUT_MODES = ('first_success', 'all', 'quorum')
+
 @dataclass
 class GeminiToken:
     """Структура для токену Gemini"""
@@ -48,9 +61,758 @@ class GeminiToken:
     usage_count: int = 0
     error_count: int = 0
 
+class JsonLogFormatter(logging.Formatter):
+    """Структурований JSON-формат записів логу"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        elif record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class LogRateLimitFilter(logging.Filter):
+    """Per-logger rate limiting (token bucket) та семплінг повторюваних помилок"""
+    
+    _DIGITS = re.compile(r'\d+')
+    
+    def __init__(self, stats: Dict[str, int], rate_per_second: float = 100, burst: int = 200,
+                 sample_after: int = 5, sample_every: int = 100, sample_window: float = 60,
+                 exempt_loggers: Optional[List[str]] = None):
+        super().__init__()
+        self.stats = stats
+        # Логери без rate limiting (напр. access log - кожен рядок потрібен, обмежує лише черга)
+        self.exempt_loggers = set(exempt_loggers if exempt_loggers is not None else ['gunicorn.access'])
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.sample_after = sample_after
+        self.sample_every = sample_every
+        self.sample_window = sample_window
+        
+        self._lock = threading.Lock()
+        self._buckets: Dict[tuple, List[float]] = {}
+        self._repeats: Dict[str, int] = {}
+        self._window_start = time.time()
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.name in self.exempt_loggers:
+            return True
+        
+        now = time.time()
+        with self._lock:
+            # Спершу семплінг: повтори, які буде відкинуто, не витрачають токени
+            if record.levelno >= logging.WARNING and not self._sample(record, now):
+                self.stats['sampled'] += 1
+                return False
+            
+            # Token bucket на кожен logger; ERROR+ мають окремий bucket, щоб балакучий
+            # логер (чи шторм попереджень) не приховав інші помилки
+            bucket_key = (record.name, record.levelno >= logging.ERROR)
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                bucket = self._buckets[bucket_key] = [float(self.burst), now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_per_second)
+            bucket[1] = now
+            if bucket[0] < 1:
+                self.stats['rate_limited'] += 1
+                return False
+            bucket[0] -= 1
+            return True
+    
+    def _sample(self, record: logging.LogRecord, now: float) -> bool:
+        """Семплінг однакових попереджень/помилок (напр. шторм 429 на одному ключі)"""
+        if now - self._window_start > self.sample_window:
+            self._repeats.clear()
+            self._window_start = now
+        
+        key = f"{record.name}:{record.levelno}:{self._DIGITS.sub('#', record.getMessage()[:160])}"
+        count = self._repeats.get(key, 0) + 1
+        self._repeats[key] = count
+        
+        if count <= self.sample_after:
+            return True
+        if (count - self.sample_after) % self.sample_every != 0:
+            return False
+        record.suppressed = self.sample_every - 1
+        return True
+
+class DroppingQueueHandler(logging.Handler):
+    """Передає записи у фоновий writer через обмежену чергу; при переповненні запис відкидається"""
+    
+    def __init__(self, async_logging: 'AsyncLogging', targets: List[logging.Handler]):
+        super().__init__()
+        self.async_logging = async_logging
+        self.targets = targets
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Фіксуємо повідомлення зараз (аргументи можуть змінитися), решта форматування - у writer
+        record.msg = record.getMessage()
+        record.args = None
+        if getattr(record, 'suppressed', 0) and not self.async_logging.json_format:
+            record.msg += f" [пропущено {record.suppressed} схожих записів]"
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.async_logging.queue.put_nowait((self.targets, self.prepare(record)))
+        except queue.Full:
+            self.async_logging.stats['queue_full'] += 1
+        except Exception:
+            self.handleError(record)
+
+class AsyncLogging:
+    """Неблокуюче логування: обмежена in-memory черга та фоновий writer"""
+    
+    def __init__(self, queue_size: int = 10000, json_format: bool = False, **filter_options):
+        self.queue_size = queue_size
+        self.json_format = json_format
+        self.stats = {'queue_full': 0, 'rate_limited': 0, 'sampled': 0}
+        self.filter = LogRateLimitFilter(self.stats, **filter_options)
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._targets: List[logging.Handler] = []
+    
+    def install(self, target_logger: logging.Logger):
+        """Переводить handlers логера за чергу (повторний виклик нічого не змінює)"""
+        if any(isinstance(h, DroppingQueueHandler) for h in target_logger.handlers):
+            return
+        
+        targets = target_logger.handlers[:]
+        if self.json_format:
+            for handler in targets:
+                handler.setFormatter(JsonLogFormatter())
+        
+        queue_handler = DroppingQueueHandler(self, targets)
+        queue_handler.addFilter(self.filter)
+        target_logger.handlers = [queue_handler]
+        self._targets.extend(targets)
+    
+    def reopen_files(self):
+        """Перевідкриття файлових handlers за чергою (ротація логів по SIGUSR1)"""
+        for handler in self._targets:
+            if isinstance(handler, logging.FileHandler) and handler.stream is not None:
+                handler.acquire()
+                try:
+                    handler.stream.close()
+                    handler.stream = handler._open()
+                finally:
+                    handler.release()
+    
+    def start(self):
+        """Запуск writer у поточному процесі (після fork gunicorn - з новою чергою)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        
+        if self._pid is not None and self._pid != os.getpid():
+            self.queue = queue.Queue(maxsize=self.queue_size)
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._writer, name='log-writer', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Дописує залишок черги перед завершенням процесу"""
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            return
+        self.queue.put(None)
+        self._thread.join(timeout=5)
+    
+    def _writer(self):
+        records = self.queue
+        while True:
+            item = records.get()
+            if item is None:
+                break
+            targets, record = item
+            for handler in targets:
+                if record.levelno >= handler.level:
+                    try:
+                        handler.handle(record)
+                    except Exception:
+                        handler.handleError(record)
+    
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+@dataclass
+class PromptFingerprint:
+    """Нормалізований промпт і його MinHash сигнатура (обчислюється один раз на запит)"""
+    normalized: str
+    raw: str
+    signature: Optional[array] = None
+
+class NearDuplicateCache:
+    """In-memory кеш майже однакових промптів (MinHash + LSH) з LRU витісненням"""
+    
+    _MERSENNE_PRIME = (1 << 61) - 1
+    _MAX_HASH = (1 << 32) - 1
+    _WHITESPACE = re.compile(r'\s+')
+    # Лише таймстемпи та id-подібні фрагменти; числа, дати та інший вміст промпту не чіпаємо
+    _NORMALIZE_PATTERNS = [
+        (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b'), ' <uuid> '),
+        (re.compile(r'\b\d{4}-\d{2}-\d{2}[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?\b'), ' <ts> '),
+        (re.compile(r'\b\d{2}:\d{2}:\d{2}(?:\.\d+)?\b'), ' <ts> '),
+        (re.compile(r'\b(?=[0-9a-f]*\d)(?=[0-9a-f]*[a-f])[0-9a-f]{16,}\b'), ' <id> '),
+    ]
+    
+    def __init__(self, max_entries: int = 10000, num_perm: int = 64, bands: int = 8,
+                 shingle_size: int = 3, max_shingles: int = 512, seed: int = 42):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm має ділитися на bands без остачі")
+        
+        self.max_entries = max_entries
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_shingles = max_shingles
+        
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randrange(1, self._MERSENNE_PRIME), rng.randrange(0, self._MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        
+        # entry_id -> (model, normalized_prompt, raw_prompt, signature, response)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._exact: Dict[tuple, int] = {}
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._next_id = 0
+        # Кеш використовується і з обробників запитів, і з потоку фонових задач
+        self._lock = threading.Lock()
+        
+        self.stats = {'hits': 0, 'exact_hits': 0, 'misses': 0, 'evictions': 0}
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    @classmethod
+    def normalize(cls, prompt: str) -> str:
+        """Нормалізація промпту: регістр, пробіли, таймстемпи та id-фрагменти"""
+        text = prompt.lower()
+        for pattern, replacement in cls._NORMALIZE_PATTERNS:
+            text = pattern.sub(replacement, text)
+        return cls._WHITESPACE.sub(' ', text).strip()
+    
+    @classmethod
+    def collapse_whitespace(cls, prompt: str) -> str:
+        return cls._WHITESPACE.sub(' ', prompt).strip()
+    
+    def signature(self, normalized: str) -> array:
+        """MinHash сигнатура для нормалізованого промпту"""
+        words = normalized.split(' ')
+        k = self.shingle_size
+        if len(words) <= k:
+            shingles = {normalized}
+        else:
+            shingles = {' '.join(words[i:i + k]) for i in range(len(words) - k + 1)}
+        
+        # Вбудований hash() стабільний у межах процесу, а кеш живе лише в пам'яті процесу
+        base_mask = self._MERSENNE_PRIME
+        hashes = [hash(s) & base_mask for s in shingles]
+        # Для дуже довгих промптів беремо bottom-k шинглів за хешем - детермінована вибірка,
+        # що зберігає оцінку схожості, а вартість сигнатури обмежена max_shingles * num_perm
+        if len(hashes) > self.max_shingles:
+            hashes = heapq.nsmallest(self.max_shingles, hashes)
+        prime = self._MERSENNE_PRIME
+        mask = self._MAX_HASH
+        return array('I', (
+            min((a * h + b) % prime for h in hashes) & mask
+            for a, b in self._permutations
+        ))
+    
+    def _band_keys(self, signature: array) -> List[int]:
+        rows = self.rows
+        return [hash(signature[i * rows:(i + 1) * rows].tobytes()) for i in range(self.bands)]
+    
+    def fingerprint(self, prompt: str) -> PromptFingerprint:
+        """Нормалізація промпту; сигнатура рахується ліниво і перевикористовується між get та put"""
+        return PromptFingerprint(normalized=self.normalize(prompt), raw=self.collapse_whitespace(prompt))
+    
+    def _signature_for(self, fingerprint: PromptFingerprint) -> array:
+        if fingerprint.signature is None:
+            fingerprint.signature = self.signature(fingerprint.normalized)
+        return fingerprint.signature
+    
+    def get(self, prompt: str, model: str, threshold: float,
+            fingerprint: Optional[PromptFingerprint] = None) -> Optional[str]:
+        """Пошук відповіді для майже однакового промпту"""
+        if fingerprint is None:
+            fingerprint = self.fingerprint(prompt)
+        normalized = fingerprint.normalized
+        # Поріг 1.0 - лише ідентичний промпт (з точністю до пробілів), без нормалізації
+        strict = threshold >= 1.0
+        
+        with self._lock:
+            entry_id = self._exact.get((model, normalized))
+            if entry_id is not None and (not strict or self._entries[entry_id][2] == fingerprint.raw):
+                self._entries.move_to_end(entry_id)
+                self.stats['hits'] += 1
+                self.stats['exact_hits'] += 1
+                return self._entries[entry_id][4]
+            if strict:
+                self.stats['misses'] += 1
+                return None
+        
+        signature = self._signature_for(fingerprint)
+        with self._lock:
+            return self._lookup(signature, model, threshold)
+    
+    def _lookup(self, signature: array, model: str, threshold: float) -> Optional[str]:
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        
+        best_id = None
+        best_similarity = threshold
+        for candidate_id in candidates:
+            entry_model, _, _, entry_signature, _ = self._entries[candidate_id]
+            if entry_model != model:
+                continue
+            similarity = sum(
+                1 for x, y in zip(signature, entry_signature) if x == y
+            ) / self.num_perm
+            if similarity >= best_similarity:
+                best_id, best_similarity = candidate_id, similarity
+        
+        if best_id is None:
+            self.stats['misses'] += 1
+            return None
+        
+        self._entries.move_to_end(best_id)
+        self.stats['hits'] += 1
+        return self._entries[best_id][4]
+    
+    def put(self, prompt: str, model: str, response: str,
+            fingerprint: Optional[PromptFingerprint] = None):
+        """Збереження відповіді з LRU витісненням"""
+        if fingerprint is None:
+            fingerprint = self.fingerprint(prompt)
+        signature = self._signature_for(fingerprint)
+        with self._lock:
+            self._insert(model, fingerprint.normalized, fingerprint.raw, signature, response)
+    
+    def _insert(self, model: str, normalized: str, raw: str, signature: array, response: str):
+        existing_id = self._exact.get((model, normalized))
+        if existing_id is not None:
+            self._remove(existing_id)
+        
+        entry_id = self._next_id
+        self._next_id += 1
+        
+        self._entries[entry_id] = (model, normalized, raw, signature, response)
+        self._exact[(model, normalized)] = entry_id
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, []).append(entry_id)
+        
+        while len(self._entries) > self.max_entries:
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+            self.stats['evictions'] += 1
+    
+    def _remove(self, entry_id: int):
+        model, normalized, _, signature, _ = self._entries.pop(entry_id)
+        self._exact.pop((model, normalized), None)
+        for band, key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(key)
+            if bucket is None:
+                continue
+            bucket.remove(entry_id)
+            if not bucket:
+                del self._buckets[band][key]
+
+class JobManager:
+    """Асинхронні задачі делегування: пул воркерів у фоновому потоці, результати в sqlite"""
+    
+    FINISHED_STATUSES = ('succeeded', 'failed')
+    
+    def __init__(self, executor, db_path: str = '/app/data/jobs.sqlite', max_workers: int = 4,
+                 max_queue: int = 100, job_timeout: float = 3600, ttl_seconds: float = 3600,
+                 cleanup_interval: float = 300, claim_interval: float = 5, max_attempts: int = 3):
+        self.executor = executor
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.ttl_seconds = ttl_seconds
+        self.cleanup_interval = cleanup_interval
+        self.claim_interval = claim_interval
+        self.max_attempts = max_attempts
+        
+        self._lock = threading.Lock()
+        # id задач, вже запланованих у цьому процесі
+        self._scheduled: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        
+        self.stats = {
+            'submitted': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'rejected': 0,
+            'queued': 0,
+            'running': 0,
+            'latency_sum': 0.0,
+            'latency_count': 0,
+            'queue_wait_sum': 0.0,
+            'queue_wait_count': 0
+        }
+        
+        self.init_db()
+    
+    @contextmanager
+    def connect(self):
+        """З'єднання з sqlite: commit при успіху, rollback при помилці, завжди закривається"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def init_db(self):
+        """Створення таблиці задач"""
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    agent_type TEXT NOT NULL,
+                    task TEXT NOT NULL,
+                    parameters TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    expires_at REAL,
+                    owner_pid INTEGER,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'owner_pid' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN owner_pid INTEGER')
+            if 'attempts' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_expires_at ON jobs (expires_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+        
+        self.requeue_orphaned_jobs()
+    
+    def start(self):
+        """Запуск пулу в поточному процесі (gunicorn post_fork), щоб воркер підхоплював задачі з черги"""
+        with self._lock:
+            self._ensure_worker()
+    
+    def _ensure_worker(self):
+        """Запуск event loop воркерів у поточному процесі (після fork gunicorn потік треба створити заново)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run_loop, args=(self._loop, ready), name='job-worker', daemon=True
+        )
+        self._thread.start()
+        ready.wait()
+    
+    def _run_loop(self, loop: asyncio.AbstractEventLoop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+        # ready першим: submit чекає на нього, тримаючи _lock, який потрібен claim_task
+        loop.call_soon(ready.set)
+        loop.create_task(self.cleanup_task())
+        loop.create_task(self.claim_task())
+        loop.run_forever()
+    
+    def status_counts(self) -> Dict[str, int]:
+        """Кількість задач за статусом (спільна для всіх воркерів gunicorn)"""
+        with self.connect() as conn:
+            rows = conn.execute('SELECT status, COUNT(*) AS count FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['count'] for row in rows}
+    
+    def submit(self, agent_type: str, task: str, parameters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Постановка задачі в чергу. Повертає None, якщо черга переповнена"""
+        if not isinstance(task, str):
+            raise ValueError("task має бути рядком")
+        if not isinstance(parameters, dict):
+            raise ValueError("parameters має бути об'єктом")
+        
+        job_id = uuid.uuid4().hex
+        
+        with self._lock:
+            self._ensure_worker()
+            if self.stats['queued'] >= self.max_queue:
+                self.stats['rejected'] += 1
+                return None
+            
+            created_at = time.time()
+            with self.connect() as conn:
+                conn.execute(
+                    'INSERT INTO jobs (id, status, agent_type, task, parameters, created_at, owner_pid) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (job_id, 'queued', agent_type, task, json.dumps(parameters, ensure_ascii=False),
+                     created_at, os.getpid())
+                )
+            # Лічильники змінюємо лише після успішного запису в sqlite
+            self.stats['queued'] += 1
+            self.stats['submitted'] += 1
+            self._scheduled.add(job_id)
+        
+        asyncio.run_coroutine_threadsafe(
+            self.run_job(job_id, agent_type, task, parameters, created_at), self._loop
+        )
+        return self.get(job_id)
+    
+    async def run_job(self, job_id: str, agent_type: str, task: str,
+                      parameters: Dict[str, Any], created_at: float):
+        """Виконання задачі в межах обмеженого пулу"""
+        async with self._semaphore:
+            started_at = time.time()
+            with self._lock:
+                self.stats['queued'] -= 1
+                self.stats['running'] += 1
+                self.stats['queue_wait_sum'] += started_at - created_at
+                self.stats['queue_wait_count'] += 1
+            
+            status = 'failed'
+            try:
+                with self.connect() as conn:
+                    conn.execute(
+                        'UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 '
+                        'WHERE id = ? AND owner_pid = ?',
+                        ('running', started_at, job_id, os.getpid())
+                    )
+                
+                try:
+                    result = await asyncio.wait_for(
+                        self.executor(agent_type, task, **parameters), timeout=self.job_timeout
+                    )
+                except asyncio.TimeoutError:
+                    result = {'success': False, 'error': f"Перевищено час виконання задачі ({self.job_timeout}s)"}
+                except Exception as e:
+                    logger.error("Помилка виконання задачі %s: %s", job_id, e)
+                    result = {'success': False, 'error': str(e)}
+                
+                status = 'succeeded' if result.get('success') else 'failed'
+                self.finish(job_id, status, result)
+            except Exception as e:
+                logger.error("Не вдалося зберегти стан задачі %s: %s", job_id, e)
+            finally:
+                with self._lock:
+                    self._scheduled.discard(job_id)
+                    self.stats['running'] -= 1
+                    self.stats[status] += 1
+                    self.stats['latency_sum'] += time.time() - created_at
+                    self.stats['latency_count'] += 1
+    
+    def finish(self, job_id: str, status: str, result: Dict[str, Any]):
+        """Запис фінального стану задачі (лише якщо задача досі належить цьому процесу)"""
+        finished_at = time.time()
+        with self.connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, expires_at = ? '
+                "WHERE id = ? AND owner_pid = ? AND status IN ('queued', 'running')",
+                (status, json.dumps(result, ensure_ascii=False), result.get('error'),
+                 finished_at, finished_at + self.ttl_seconds, job_id, os.getpid())
+            )
+    
+    def claim_jobs(self) -> int:
+        """Забирає в цей процес задачі без власника (після перезапуску воркера) і планує їх"""
+        pid = os.getpid()
+        with self._lock:
+            capacity = self.max_queue - self.stats['queued']
+            if capacity <= 0:
+                return 0
+            
+            with self.connect() as conn:
+                conn.execute(
+                    "UPDATE jobs SET owner_pid = ? WHERE id IN ("
+                    "SELECT id FROM jobs WHERE status = 'queued' AND owner_pid IS NULL "
+                    "ORDER BY created_at LIMIT ?)",
+                    (pid, capacity)
+                )
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND owner_pid = ?", (pid,)
+                ).fetchall()
+            
+            claimed = [row for row in rows if row['id'] not in self._scheduled]
+            for row in claimed:
+                self._scheduled.add(row['id'])
+                self.stats['queued'] += 1
+        
+        for row in claimed:
+            asyncio.run_coroutine_threadsafe(
+                self.run_job(row['id'], row['agent_type'], row['task'],
+                             json.loads(row['parameters']) if row['parameters'] else {},
+                             row['created_at']),
+                self._loop
+            )
+        if claimed:
+            logger.info("Підхоплено %s задач з черги", len(claimed))
+        return len(claimed)
+    
+    async def claim_task(self):
+        """Фонове підхоплення задач без власника"""
+        while True:
+            try:
+                self.claim_jobs()
+            except Exception as e:
+                logger.error(f"Помилка підхоплення задач: {e}")
+            await asyncio.sleep(self.claim_interval)
+    
+    @staticmethod
+    def _pid_alive(pid: Optional[int]) -> bool:
+        if not pid:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+    
+    def _fail_unfinished(self, conn: sqlite3.Connection, where: str, params: tuple, error: str) -> int:
+        finished_at = time.time()
+        result = json.dumps({'success': False, 'error': error}, ensure_ascii=False)
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'failed', result = ?, error = ?, finished_at = ?, expires_at = ? "
+            f"WHERE status IN ('queued', 'running') AND {where}",
+            (result, error, finished_at, finished_at + self.ttl_seconds) + params
+        )
+        return cursor.rowcount
+    
+    def _requeue_unfinished(self, conn: sqlite3.Connection, where: str, params: tuple) -> Tuple[int, int]:
+        """Повертає незавершені задачі в чергу без власника; після max_attempts спроб - failed"""
+        failed = self._fail_unfinished(
+            conn, f"{where} AND attempts >= ?", params + (self.max_attempts,),
+            f"Задачу перервано перезапуском воркера {self.max_attempts} разів"
+        )
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'queued', owner_pid = NULL, started_at = NULL "
+            f"WHERE status IN ('queued', 'running') AND {where} AND attempts < ?",
+            params + (self.max_attempts,)
+        )
+        return cursor.rowcount, failed
+    
+    def requeue_orphaned_jobs(self) -> int:
+        """Повертає в чергу незавершені задачі, процес-власник яких вже не існує"""
+        with self.connect() as conn:
+            pids = [
+                row['owner_pid'] for row in conn.execute(
+                    "SELECT DISTINCT owner_pid FROM jobs "
+                    "WHERE status IN ('queued', 'running') AND owner_pid IS NOT NULL"
+                )
+            ]
+            requeued = failed = 0
+            for pid in pids:
+                if pid == os.getpid() or self._pid_alive(pid):
+                    continue
+                counts = self._requeue_unfinished(conn, 'owner_pid = ?', (pid,))
+                requeued += counts[0]
+                failed += counts[1]
+            # running без власника (старі записи) теж повертаємо в чергу
+            counts = self._requeue_unfinished(conn, "owner_pid IS NULL AND status = 'running'", ())
+            requeued += counts[0]
+            failed += counts[1]
+        if requeued or failed:
+            logger.warning("Осиротілі задачі: %s повернуто в чергу, %s позначено failed", requeued, failed)
+        return requeued
+    
+    def shutdown(self, drain_timeout: float = 0):
+        """Gunicorn worker_exit: чекаємо завершення задач до drain_timeout, решту повертаємо в чергу"""
+        if self._pid != os.getpid():
+            return
+        
+        deadline = time.time() + drain_timeout
+        while time.time() < deadline:
+            with self._lock:
+                if self.stats['queued'] + self.stats['running'] == 0:
+                    return
+            time.sleep(0.2)
+        
+        with self.connect() as conn:
+            requeued, failed = self._requeue_unfinished(conn, 'owner_pid = ?', (os.getpid(),))
+        if requeued or failed:
+            logger.warning(
+                "Воркер завершується: %s задач повернуто в чергу, %s позначено failed", requeued, failed
+            )
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Стан задачі з sqlite (доступний з будь-якого воркера gunicorn)"""
+        with self.connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        
+        job = dict(row)
+        if job['status'] not in self.FINISHED_STATUSES and job['owner_pid'] is not None \
+                and job['owner_pid'] != os.getpid() and not self._pid_alive(job['owner_pid']):
+            self.requeue_orphaned_jobs()
+            return self.get(job_id)
+        
+        job['parameters'] = json.loads(job['parameters']) if job['parameters'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['done'] = job['status'] in self.FINISHED_STATUSES
+        return job
+    
+    def wait(self, job_id: str, timeout: float, poll_interval: float = 0.5) -> Optional[Dict[str, Any]]:
+        """Long-poll: чекаємо завершення задачі не довше timeout секунд"""
+        deadline = time.time() + timeout
+        job = self.get(job_id)
+        while job is not None and not job['done'] and time.time() < deadline:
+            time.sleep(min(poll_interval, max(0.0, deadline - time.time())))
+            job = self.get(job_id)
+        return job
+    
+    def cleanup(self) -> int:
+        """Видалення задач із простроченим TTL"""
+        now = time.time()
+        with self.connect() as conn:
+            cursor = conn.execute(
+                'DELETE FROM jobs WHERE expires_at < ? OR (finished_at IS NULL AND created_at < ?)',
+                (now, now - self.job_timeout - self.ttl_seconds)
+            )
+            return cursor.rowcount
+    
+    async def cleanup_task(self):
+        """Фонова TTL очистка задач"""
+        while True:
+            try:
+                await asyncio.sleep(self.cleanup_interval)
+                self.requeue_orphaned_jobs()
+                removed = self.cleanup()
+                if removed:
+                    logger.info(f"Видалено {removed} прострочених задач")
+            except Exception as e:
+                logger.error(f"Помилка очистки задач: {e}")
+
 class GeminiProxyServer:
     def __init__(self, config_path: str = "/app/config/config.yaml"):
         self.config = self.load_config(config_path)
+        self.async_logging = self.setup_logging()
         self.app = self.create_app()
         self.setup_routes()
         
@@ -59,6 +821,8 @@ class GeminiProxyServer:
         self.token_rotation = 0
         self.active_sessions = {}
         self.request_history = deque(maxlen=1000)
+        self.near_duplicate_cache = self.create_near_duplicate_cache()
+        self.job_manager = self.create_job_manager()
         self.metrics = {
             'total_requests': 0,
             'successful_requests': 0,
@@ -93,7 +857,7 @@ class GeminiProxyServer:
     def get_default_config(self) -> Dict[str, Any]:
         """Стандартна конфігурація"""
         return {
-            'server': {'host': '0.0.0.0', 'port': 8080},
+            'server': {'host': '0.0.0.0', 'port': 8080, 'threads': 16},
             'security': {'jwt_secret': 'demo-secret'},
             'cors': {'allowed_origins': ['http://localhost:3000']},
             'rate_limit': {'requests_per_minute': 100},
@@ -103,9 +867,86 @@ class GeminiProxyServer:
                 'gemini': {'endpoint': 'local'},
                 'claude': {'endpoint': 'local'}
             },
-            'monitoring': {'metrics_enabled': True, 'metrics_port': 9090}
+            'monitoring': {'metrics_enabled': True, 'metrics_port': 9090},
+            'cache': {
+                'near_duplicate': {
+                    'enabled': True,
+                    'max_entries': 10000,
+                    'num_perm': 64,
+                    'bands': 8,
+                    'max_shingles': 512,
+                    'threshold': 0.9,
+                    'route_thresholds': {
+                        '/api/gemini/generate': 0.9,
+                        '/v1/chat/completions': 0.95
+                    }
+                }
+            },
+            'logging': {
+                'mode': 'sync',
+                'format': 'text',
+                'queue_size': 10000,
+                'rate_limit_per_second': 100,
+                'rate_limit_burst': 200,
+                'sample_after': 5,
+                'sample_every': 100,
+                'sample_window_seconds': 60,
+                'rate_limit_exempt': ['gunicorn.access']
+            },
+            'jobs': {
+                'db_path': '/app/data/jobs.sqlite',
+                'max_workers': 4,
+                'max_queue': 100,
+                'job_timeout': 3600,
+                'ttl_seconds': 3600,
+                'cleanup_interval': 300,
+                'max_wait_seconds': 25,
+                'drain_timeout': 20,
+                'claim_interval': 5,
+                'max_attempts': 3
+            }
         }
     
+    def setup_logging(self) -> Optional[AsyncLogging]:
+        """Налаштування логування: sync (за замовчуванням) або async через чергу"""
+        log_config = self.config.get('logging', {})
+        json_format = log_config.get('format', 'text') == 'json'
+        root_logger = logging.getLogger()
+        
+        if log_config.get('mode', 'sync') != 'async':
+            if json_format:
+                for handler in root_logger.handlers:
+                    handler.setFormatter(JsonLogFormatter())
+            return None
+        
+        async_logging = AsyncLogging(
+            queue_size=log_config.get('queue_size', 10000),
+            json_format=json_format,
+            rate_per_second=log_config.get('rate_limit_per_second', 100),
+            burst=log_config.get('rate_limit_burst', 200),
+            sample_after=log_config.get('sample_after', 5),
+            sample_every=log_config.get('sample_every', 100),
+            sample_window=log_config.get('sample_window_seconds', 60),
+            exempt_loggers=log_config.get('rate_limit_exempt', ['gunicorn.access'])
+        )
+        async_logging.install(root_logger)
+        async_logging.start()
+        atexit.register(async_logging.stop)
+        return async_logging
+    
+    def on_worker_fork(self, server, worker):
+        """Gunicorn post_fork: новий writer логів і пул задач у воркері"""
+        if self.async_logging:
+            self.async_logging.start()
+            for name in ('gunicorn.access', 'gunicorn.error'):
+                self.async_logging.install(logging.getLogger(name))
+        if self.job_manager:
+            self.job_manager.start()
+    
+    def on_worker_exit(self, server, worker):
+        """Gunicorn worker_exit: дочікуємо задачі воркера, решту повертаємо в чергу"""
+        self.job_manager.shutdown(self.config.get('jobs', {}).get('drain_timeout', 20))
+    
     def create_app(self):
         """Створення Flask додатку"""
         if not FLASK_AVAILABLE:
@@ -121,6 +962,50 @@ class GeminiProxyServer:
 
         return app
     
+    def create_near_duplicate_cache(self) -> Optional[NearDuplicateCache]:
+        """Створення кешу майже однакових промптів"""
+        cache_config = self.config.get('cache', {}).get('near_duplicate', {})
+        if not cache_config.get('enabled', True):
+            return None
+        
+        try:
+            return NearDuplicateCache(
+                max_entries=cache_config.get('max_entries', 10000),
+                num_perm=cache_config.get('num_perm', 64),
+                bands=cache_config.get('bands', 8),
+                max_shingles=cache_config.get('max_shingles', 512)
+            )
+        except ValueError as e:
+            logger.warning(f"Near-duplicate кеш вимкнено: {e}")
+            return None
+    
+    def create_job_manager(self) -> Optional[JobManager]:
+        """Створення менеджера асинхронних задач"""
+        jobs_config = self.config.get('jobs', {})
+        try:
+            return JobManager(
+                self.delegate_to_agent,
+                db_path=jobs_config.get('db_path', '/app/data/jobs.sqlite'),
+                max_workers=jobs_config.get('max_workers', 4),
+                max_queue=jobs_config.get('max_queue', 100),
+                job_timeout=jobs_config.get('job_timeout', 3600),
+                ttl_seconds=jobs_config.get('ttl_seconds', 3600),
+                cleanup_interval=jobs_config.get('cleanup_interval', 300),
+                claim_interval=jobs_config.get('claim_interval', 5),
+                max_attempts=jobs_config.get('max_attempts', 3)
+            )
+        except Exception as e:
+            logger.error(f"Не вдалося ініціалізувати сховище задач: {e}")
+            return None
+    
+    def get_similarity_threshold(self, route: Optional[str] = None) -> float:
+        """Поріг схожості для near-duplicate кешу з урахуванням маршруту"""
+        cache_config = self.config.get('cache', {}).get('near_duplicate', {})
+        route_thresholds = cache_config.get('route_thresholds', {})
+        if route and route in route_thresholds:
+            return route_thresholds[route]
+        return cache_config.get('threshold', 0.9)
+    
     def load_gemini_tokens(self) -> List[GeminiToken]:
         """Завантаження Gemini токенів"""
         tokens = []
@@ -297,8 +1182,21 @@ class GeminiProxyServer:
         
         return selected_token
     
-    async def call_gemini_api(self, prompt: str, model: str = 'gemini-pro', **params) -> str:
+    async def call_gemini_api(self, prompt: str, model: str = 'gemini-pro',
+                              near_duplicate_cache: bool = False,
+                              similarity_threshold: Optional[float] = None, **params) -> str:
         """Виклик Gemini API"""
+        # Near-duplicate кеш вмикається лише явно для конкретного запиту
+        use_cache = near_duplicate_cache is True and self.near_duplicate_cache is not None
+        fingerprint = None
+        if use_cache:
+            if similarity_threshold is None:
+                similarity_threshold = self.get_similarity_threshold()
+            fingerprint = self.near_duplicate_cache.fingerprint(prompt)
+            cached = self.near_duplicate_cache.get(prompt, model, similarity_threshold, fingerprint=fingerprint)
+            if cached is not None:
+                return cached
+        
         token = self.get_next_token()
         if not token:
             raise Exception("Немає доступних токенів")
@@ -344,13 +1242,15 @@ class GeminiProxyServer:
                                 response_text = parts[0]['text']
                                 token.last_used = time.time()
                                 token.usage_count += 1
+                                if use_cache:
+                                    self.near_duplicate_cache.put(prompt, model, response_text, fingerprint=fingerprint)
                                 return response_text
 
                     raise Exception("Некоректна відповідь від Gemini API")
 
         except Exception as e:
             token.error_count += 1
-            logger.error(f"Помилка Gemini API: {e}")
+            logger.error("Помилка Gemini API: %s", e)
             raise
     
     async def delegate_to_agent(self, agent_type: str, task: str, **parameters) -> Dict[str, Any]:
@@ -394,9 +1294,15 @@ class GeminiProxyServer:
                 'timestamp': datetime.now().isoformat()
             }
             
+        except asyncio.CancelledError:
+            # Задачу скасовано (fan-out або timeout) - звільняємо з'єднання і пробрасуємо далі
+            self.agent_load_balancer[agent_type]['connections'] -= 1
+            raise
+            
         except Exception as e:
             execution_time = time.time() - start_time
-            self.agent_load_balancer[agent_type]['connections'] -= 1
+            if agent_type in self.agent_load_balancer:
+                self.agent_load_balancer[agent_type]['connections'] -= 1
             
             return {
                 'success': False,
@@ -406,6 +1312,132 @@ class GeminiProxyServer:
                 'timestamp': datetime.now().isoformat()
             }
     
+    async def fanout_to_agents(self, agent_types: List[str], task: str, mode: str = 'all',
+                               quorum: Optional[int] = None, timeout: Optional[float] = None,
+                               parameters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Паралельне делегування завдання кільком агентам (first_success / all / quorum)"""
+        start_time = time.time()
+        
+        if not agent_types:
+            raise ValueError("Потрібен хоча б один agent_type")
+        if mode not in FANOUT_MODES:
+            raise ValueError(f"Невідомий режим fan-out: {mode}")
+        
+        if mode == 'first_success':
+            required = 1
+        elif mode == 'quorum':
+            if isinstance(quorum, bool) or not isinstance(quorum, int) or not 1 <= quorum <= len(agent_types):
+                raise ValueError(f"quorum має бути цілим числом від 1 до {len(agent_types)}")
+            required = quorum
+        else:
+            required = len(agent_types)
+        
+        if timeout is None:
+            timeout = self.config.get('agents', {}).get('fanout_timeout', 60)
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ValueError("timeout має бути додатним числом секунд")
+        
+        parameters = parameters or {}
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(agent_types)
+        
+        async def run_agent(index: int, agent_type: str) -> Dict[str, Any]:
+            agent_start = time.time()
+            try:
+                result = await asyncio.wait_for(
+                    self.delegate_to_agent(agent_type, task, **parameters),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                result = {
+                    'success': False,
+                    'agent_type': agent_type,
+                    'error': f"Перевищено час очікування ({timeout}s)",
+                    'timed_out': True,
+                    'execution_time': time.time() - agent_start,
+                    'timestamp': datetime.now().isoformat()
+                }
+            except Exception as e:
+                # Помилка одного агента не повинна зривати весь fan-out
+                result = {
+                    'success': False,
+                    'agent_type': agent_type,
+                    'error': str(e),
+                    'execution_time': time.time() - agent_start,
+                    'timestamp': datetime.now().isoformat()
+                }
+            except asyncio.CancelledError:
+                results[index] = {
+                    'success': False,
+                    'agent_type': agent_type,
+                    'cancelled': True,
+                    'execution_time': time.time() - agent_start,
+                    'timestamp': datetime.now().isoformat()
+                }
+                raise
+            
+            result['index'] = index
+            results[index] = result
+            return result
+        
+        tasks = [
+            asyncio.create_task(run_agent(i, agent_type))
+            for i, agent_type in enumerate(agent_types)
+        ]
+        pending = set(tasks)
+        successful = 0
+        failed = 0
+        winner = None
+        
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    result = finished.result()
+                    if result['success']:
+                        successful += 1
+                        if winner is None:
+                            winner = result
+                    else:
+                        failed += 1
+                
+                # Режим all чекає всіх агентів (або їх timeout);
+                # first_success/quorum - достатньо успішних відповідей, або кворум вже недосяжний
+                if mode == 'all':
+                    continue
+                if successful >= required or len(agent_types) - failed < required:
+                    break
+        finally:
+            # Скасовуємо решту агентів і чекаємо, поки скасування дійде до HTTP-викликів
+            for pending_task in pending:
+                pending_task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        for index, agent_type in enumerate(agent_types):
+            if results[index] is None:
+                results[index] = {
+                    'success': False,
+                    'agent_type': agent_type,
+                    'cancelled': True,
+                    'execution_time': 0.0,
+                    'timestamp': datetime.now().isoformat()
+                }
+            results[index]['index'] = index
+        
+        return {
+            'success': successful >= required,
+            'mode': mode,
+            'required': required,
+            'successful': successful,
+            'failed': failed,
+            'cancelled': sum(1 for r in results if r.get('cancelled')),
+            'winner': winner if mode == 'first_success' else None,
+            'results': results,
+            'execution_time': time.time() - start_time,
+            'timestamp': datetime.now().isoformat()
+        }
+    
     def setup_routes(self):
         """Налаштування маршрутів"""
         if not self.app:
@@ -442,7 +1474,11 @@ class GeminiProxyServer:
             self.metrics['total_requests'] += 1
             
             try:
-                result = await self.call_gemini_api(prompt, model)
+                result = await self.call_gemini_api(
+                    prompt, model,
+                    near_duplicate_cache=data.get('near_duplicate_cache') is True,
+                    similarity_threshold=self.get_similarity_threshold(request.path)
+                )
                 execution_time = time.time() - start_time
                 
                 self.metrics['successful_requests'] += 1
@@ -508,7 +1544,11 @@ class GeminiProxyServer:
             
             try:
                 # Викликаємо існуючий метод call_gemini_api
-                result = await self.call_gemini_api(prompt, model=model)
+                result = await self.call_gemini_api(
+                    prompt, model=model,
+                    near_duplicate_cache=data.get('near_duplicate_cache') is True,
+                    similarity_threshold=self.get_similarity_threshold(request.path)
+                )
                 execution_time = time.time() - start_time
                 
                 self.metrics['successful_requests'] += 1
@@ -571,6 +1611,122 @@ class GeminiProxyServer:
             else:
                 return jsonify(result), 500
         
+        @app.route('/api/agents/fanout', methods=['POST'])
+        async def fanout_to_agents_route():
+            """Паралельне делегування завдання кільком агентам"""
+            data = request.get_json()
+            if not data or 'agent_types' not in data or 'task' not in data:
+                return jsonify({'error': 'Потрібні agent_types та task'}), 400
+            
+            agent_types = data['agent_types']
+            if not isinstance(agent_types, list):
+                return jsonify({'error': 'agent_types має бути списком'}), 400
+            
+            if not isinstance(data['task'], str):
+                return jsonify({'error': 'task має бути рядком'}), 400
+            
+            parameters = data.get('parameters', {})
+            if not isinstance(parameters, dict):
+                return jsonify({'error': 'parameters має бути об\'єктом'}), 400
+            
+            reserved = sorted(set(parameters) & {'agent_type', 'task'})
+            if reserved:
+                return jsonify({'error': f"parameters не може містити ключі: {', '.join(reserved)}"}), 400
+            
+            unknown = [a for a in agent_types if not isinstance(a, str) or a not in self.agent_load_balancer]
+            if unknown:
+                return jsonify({'error': f"Невідомі типи агентів: {', '.join(map(str, unknown))}"}), 400
+            
+            try:
+                result = await self.fanout_to_agents(
+                    agent_types,
+                    data['task'],
+                    mode=data.get('mode', 'all'),
+                    quorum=data.get('quorum'),
+                    timeout=data.get('timeout'),
+                    parameters=parameters
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            if result['success']:
+                return jsonify(result)
+            else:
+                return jsonify(result), 500
+        
+        @app.route('/api/jobs', methods=['POST'])
+        def submit_job():
+            """Асинхронне делегування завдання агенту"""
+            if not self.job_manager:
+                return jsonify({'error': 'Сховище задач недоступне'}), 503
+            
+            data = request.get_json()
+            if not data or 'agent_type' not in data or 'task' not in data:
+                return jsonify({'error': 'Потрібні agent_type та task'}), 400
+            
+            if not isinstance(data['agent_type'], str) or data['agent_type'] not in self.agent_load_balancer:
+                return jsonify({'error': f"Невідомий тип агента: {data['agent_type']}"}), 400
+            
+            if not isinstance(data['task'], str):
+                return jsonify({'error': 'task має бути рядком'}), 400
+            
+            parameters = data.get('parameters', {})
+            if not isinstance(parameters, dict):
+                return jsonify({'error': 'parameters має бути об\'єктом'}), 400
+            
+            job = self.job_manager.submit(data['agent_type'], data['task'], parameters)
+            if job is None:
+                return jsonify({'error': 'Черга задач переповнена'}), 503, {'Retry-After': '5'}
+            
+            return jsonify(job), 202, {'Location': f"/api/jobs/{job['id']}"}
+        
+        @app.route('/api/jobs/<job_id>', methods=['GET'])
+        def get_job(job_id):
+            """Стан задачі; ?wait=N - long-poll до завершення"""
+            if not self.job_manager:
+                return jsonify({'error': 'Сховище задач недоступне'}), 503
+            
+            max_wait = self.config.get('jobs', {}).get('max_wait_seconds', 25)
+            wait = min(max(request.args.get('wait', 0, type=float), 0.0), max_wait)
+            
+            job = self.job_manager.wait(job_id, wait) if wait else self.job_manager.get(job_id)
+            if job is None:
+                return jsonify({'error': 'Задачу не знайдено'}), 404
+            
+            return jsonify(job)
+        
+        @app.route('/api/jobs/<job_id>/events', methods=['GET'])
+        def stream_job_events(job_id):
+            """SSE потік статусу задачі"""
+            if not self.job_manager:
+                return jsonify({'error': 'Сховище задач недоступне'}), 503
+            
+            job = self.job_manager.get(job_id)
+            if job is None:
+                return jsonify({'error': 'Задачу не знайдено'}), 404
+            
+            max_wait = self.config.get('jobs', {}).get('max_wait_seconds', 25)
+            
+            def events():
+                # Потік обмежений max_wait_seconds, щоб не тримати потік gthread-воркера безкінечно;
+                # клієнт EventSource перепідключається автоматично
+                deadline = time.time() + max_wait
+                last_status = None
+                current = job
+                yield 'retry: 1000\n\n'
+                while current is not None:
+                    if current['status'] != last_status:
+                        last_status = current['status']
+                        event = 'done' if current['done'] else 'status'
+                        yield f"event: {event}\ndata: {json.dumps(current, ensure_ascii=False)}\n\n"
+                    if current['done'] or time.time() >= deadline:
+                        break
+                    time.sleep(0.5)
+                    current = self.job_manager.get(job_id)
+            
+            return Response(events(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        
         @app.route('/api/agents/status', methods=['GET'])
         def get_agents_status():
             """Статус агентів"""
@@ -616,6 +1772,14 @@ class GeminiProxyServer:
             """Prometheus-compatible metrics"""
             uptime = time.time() - self.metrics['start_time']
             success_rate = self.metrics['successful_requests'] / max(1, self.metrics['total_requests'])
+            cache_stats = self.near_duplicate_cache.stats if self.near_duplicate_cache else {}
+            cache_entries = len(self.near_duplicate_cache) if self.near_duplicate_cache else 0
+            pid = os.getpid()
+            # Черга/виконання - з sqlite (спільне для всіх воркерів); лічильники - per-worker з міткою pid
+            job_stats = self.job_manager.stats if self.job_manager else {}
+            job_counts = self.job_manager.status_counts() if self.job_manager else {}
+            log_stats = self.async_logging.stats if self.async_logging else {}
+            log_queue_depth = self.async_logging.queue_depth() if self.async_logging else 0
             
             metrics_text = f"""# HELP gemini_proxy_requests_total Total number of requests
 # TYPE gemini_proxy_requests_total counter
@@ -648,6 +1812,63 @@ gemini_proxy_active_tokens {len([t for t in self.tokens if t.active])}
 # HELP gemini_proxy_active_connections Number of active connections
 # TYPE gemini_proxy_active_connections gauge
 gemini_proxy_active_connections {sum(d['connections'] for d in self.agent_load_balancer.values())}
+
+# HELP gemini_proxy_near_duplicate_cache_hits Near-duplicate cache hits
+# TYPE gemini_proxy_near_duplicate_cache_hits counter
+gemini_proxy_near_duplicate_cache_hits{{pid="{pid}"}} {cache_stats.get('hits', 0)}
+
+# HELP gemini_proxy_near_duplicate_cache_misses Near-duplicate cache misses
+# TYPE gemini_proxy_near_duplicate_cache_misses counter
+gemini_proxy_near_duplicate_cache_misses{{pid="{pid}"}} {cache_stats.get('misses', 0)}
+
+# HELP gemini_proxy_near_duplicate_cache_evictions Near-duplicate cache LRU evictions
+# TYPE gemini_proxy_near_duplicate_cache_evictions counter
+gemini_proxy_near_duplicate_cache_evictions{{pid="{pid}"}} {cache_stats.get('evictions', 0)}
+
+# HELP gemini_proxy_near_duplicate_cache_entries Entries in near-duplicate cache
+# TYPE gemini_proxy_near_duplicate_cache_entries gauge
+gemini_proxy_near_duplicate_cache_entries{{pid="{pid}"}} {cache_entries}
+
+# HELP gemini_proxy_jobs_queue_depth Jobs waiting for a free worker (all gunicorn workers)
+# TYPE gemini_proxy_jobs_queue_depth gauge
+gemini_proxy_jobs_queue_depth {job_counts.get('queued', 0)}
+
+# HELP gemini_proxy_jobs_running Jobs currently executing (all gunicorn workers)
+# TYPE gemini_proxy_jobs_running gauge
+gemini_proxy_jobs_running {job_counts.get('running', 0)}
+
+# HELP gemini_proxy_jobs_submitted_total Jobs accepted into the queue
+# TYPE gemini_proxy_jobs_submitted_total counter
+gemini_proxy_jobs_submitted_total{{pid="{pid}"}} {job_stats.get('submitted', 0)}
+
+# HELP gemini_proxy_jobs_rejected_total Jobs rejected because the queue was full
+# TYPE gemini_proxy_jobs_rejected_total counter
+gemini_proxy_jobs_rejected_total{{pid="{pid}"}} {job_stats.get('rejected', 0)}
+
+# HELP gemini_proxy_jobs_finished_total Finished jobs by status
+# TYPE gemini_proxy_jobs_finished_total counter
+gemini_proxy_jobs_finished_total{{status="succeeded",pid="{pid}"}} {job_stats.get('succeeded', 0)}
+gemini_proxy_jobs_finished_total{{status="failed",pid="{pid}"}} {job_stats.get('failed', 0)}
+
+# HELP gemini_proxy_job_latency_seconds Time from submission to completion
+# TYPE gemini_proxy_job_latency_seconds summary
+gemini_proxy_job_latency_seconds_sum{{pid="{pid}"}} {job_stats.get('latency_sum', 0.0)}
+gemini_proxy_job_latency_seconds_count{{pid="{pid}"}} {job_stats.get('latency_count', 0)}
+
+# HELP gemini_proxy_job_queue_wait_seconds Time jobs spent waiting in the queue
+# TYPE gemini_proxy_job_queue_wait_seconds summary
+gemini_proxy_job_queue_wait_seconds_sum{{pid="{pid}"}} {job_stats.get('queue_wait_sum', 0.0)}
+gemini_proxy_job_queue_wait_seconds_count{{pid="{pid}"}} {job_stats.get('queue_wait_count', 0)}
+
+# HELP gemini_proxy_log_records_dropped_total Log records dropped by the async logging pipeline
+# TYPE gemini_proxy_log_records_dropped_total counter
+gemini_proxy_log_records_dropped_total{{reason="queue_full",pid="{pid}"}} {log_stats.get('queue_full', 0)}
+gemini_proxy_log_records_dropped_total{{reason="rate_limited",pid="{pid}"}} {log_stats.get('rate_limited', 0)}
+gemini_proxy_log_records_dropped_total{{reason="sampled",pid="{pid}"}} {log_stats.get('sampled', 0)}
+
+# HELP gemini_proxy_log_queue_depth Log records waiting for the background writer
+# TYPE gemini_proxy_log_queue_depth gauge
+gemini_proxy_log_queue_depth{{pid="{pid}"}} {log_queue_depth}
 """
             
             return metrics_text, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
@@ -675,6 +1896,16 @@ gemini_proxy_active_connections {sum(d['connections'] for d in self.agent_load_b
         try:
             # Запуск через Gunicorn
             from gunicorn.app.wsgiapp import WSGIApplication
+            from gunicorn.glogging import Logger as GunicornLogger
+            
+            async_logging = self.async_logging
+            
+            class QueuedGunicornLogger(GunicornLogger):
+                def reopen_files(self):
+                    # Файлові handlers access/error логів сховані за чергою - перевідкриваємо і їх
+                    super().reopen_files()
+                    if async_logging:
+                        async_logging.reopen_files()
             
             class StandaloneApplication(WSGIApplication):
                 def __init__(self, app, options=None):
@@ -696,7 +1927,9 @@ gemini_proxy_active_connections {sum(d['connections'] for d in self.agent_load_b
             options = {
                 'bind': f'{host}:{port}',
                 'workers': 4,
-                'worker_class': 'sync',
+                # gthread: long-poll/SSE по задачах займає потік, а не весь воркер
+                'worker_class': 'gthread',
+                'threads': self.config['server'].get('threads', 16),
                 'timeout': 60,
                 'max_requests': 1000,
                 'max_requests_jitter': 50,
@@ -706,6 +1939,20 @@ gemini_proxy_active_connections {sum(d['connections'] for d in self.agent_load_b
                 'loglevel': 'info'
             }
             
+            if self.job_manager:
+                # Задачі виконуються у воркерах: без планового перезапуску по max_requests
+                # (polling самих задач швидко вичерпав би ліміт), а при будь-якому іншому
+                # завершенні воркера незавершені задачі повертаються в чергу іншим воркерам
+                options['max_requests'] = 0
+                options['worker_exit'] = self.on_worker_exit
+            
+            if self.async_logging:
+                # Access/error логи воркерів пишуться через фоновий writer, а не з обробника запиту
+                options['logger_class'] = QueuedGunicornLogger
+            
+            if self.job_manager or self.async_logging:
+                options['post_fork'] = self.on_worker_fork
+            
             StandaloneApplication(self.app, options).run()
             
         except Exception as e:
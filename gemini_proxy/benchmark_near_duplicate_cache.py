@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк near-duplicate кешу промптів (MinHash + LSH)
+Заповнює кеш і вимірює час пошуку у порівнянні з типовим викликом Gemini API
+"""
+
+import argparse
+import os
+import random
+import sys
+import resource
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import NearDuplicateCache
+
+WORDS = (
+    "analyze refactor summarize explain review module function class request response "
+    "token cache agent task project deploy config error latency database query index "
+    "service endpoint payload schema migration test coverage release branch commit"
+).split()
+
+
+def make_prompt(rng: random.Random, length: int) -> str:
+    """Синтетичний промпт з таймстемпом та id-фрагментом"""
+    body = ' '.join(rng.choice(WORDS) for _ in range(length))
+    return f"[{time.strftime('%Y-%m-%dT%H:%M:%S')}] request {uuid.uuid4()}: {body}"
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Near-duplicate cache benchmark')
+    parser.add_argument('--entries', type=int, default=100000, help='Кількість записів у кеші')
+    parser.add_argument('--lookups', type=int, default=2000, help='Кількість пошуків')
+    parser.add_argument('--words', type=int, default=60, help='Довжина промпту в словах')
+    parser.add_argument('--threshold', type=float, default=0.9, help='Поріг схожості')
+    parser.add_argument('--upstream-ms', type=float, default=800.0,
+                        help='Типова латентність виклику Gemini API для порівняння (мс)')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    cache = NearDuplicateCache(max_entries=args.entries)
+    model = 'gemini-pro'
+
+    prompts = [make_prompt(rng, args.words) for _ in range(args.entries)]
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for i, prompt in enumerate(prompts):
+        cache.put(prompt, model, f"response {i}")
+    fill_time = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Ті самі промпти з іншим таймстемпом/id, зайвими пробілами та дописаним словом - мають бути влучання
+    hit_latencies = []
+    hits = 0
+    for prompt in rng.sample(prompts, args.lookups):
+        body = prompt.split(': ', 1)[1].replace(' ', '  ', 3)
+        variant = f"[{time.strftime('%Y-%m-%d %H:%M')}]  request {uuid.uuid4()}:\n{body} please"
+        start = time.perf_counter()
+        if cache.get(variant, model, args.threshold) is not None:
+            hits += 1
+        hit_latencies.append(time.perf_counter() - start)
+
+    # Нові промпти - мають бути промахи
+    miss_latencies = []
+    false_hits = 0
+    for _ in range(args.lookups):
+        prompt = make_prompt(rng, args.words)
+        start = time.perf_counter()
+        if cache.get(prompt, model, args.threshold) is not None:
+            false_hits += 1
+        miss_latencies.append(time.perf_counter() - start)
+
+    print(f"Записів у кеші:          {len(cache)}")
+    print(f"Час заповнення:          {fill_time:.1f}s ({fill_time / args.entries * 1000:.3f} мс/запис)")
+    print(f"Приріст RSS:             {(rss_after - rss_before) / 1024:.1f} MiB")
+    for name, latencies in (('near-duplicate', hit_latencies), ('новий промпт', miss_latencies)):
+        p50 = percentile(latencies, 0.5) * 1000
+        p99 = percentile(latencies, 0.99) * 1000
+        print(f"Пошук ({name}): p50 {p50:.3f} мс, p99 {p99:.3f} мс "
+              f"(~{args.upstream_ms / p99:.0f}x дешевше за upstream {args.upstream_ms:.0f} мс)")
+    print(f"Влучання near-duplicate: {hits}/{args.lookups}")
+    print(f"Хибні влучання:          {false_hits}/{args.lookups}")
+
+
+if __name__ == '__main__':
+    main()